@@ -6,6 +6,7 @@ from numpy.random import RandomState
 from hgdecode.utils import create_log
 from hgdecode.utils import print_manager
 from hgdecode.loaders import dl_loader
+from hgdecode.loaders import load_and_preprocess_subjects
 from hgdecode.classes import CrossValidation
 from hgdecode.experiments import DLExperiment
 from keras import backend as K
@@ -33,6 +34,9 @@ results_dir : str
 subject_ids : tuple
     All the subject ids in a tuple; add or remove subjects to run the
     algorithm for them or not
+workers : int
+    Number of processes loading subjects; if greater than 1, next subjects
+    are loaded while the model is trained on the current one
 """
 # setting model_name and validation_frac
 model_name = 'DeepConvNet'  # Schirrmeister: 'DeepConvNet' or 'ShallowNet'
@@ -73,6 +77,7 @@ learning_rate = 1e-4
 dropout_rate = 0.5
 batch_size = 64
 epochs = 1000
+workers = 1
 
 """
 MAIN CYCLE
@@ -82,7 +87,23 @@ this dataset will be used to create an instance of the experiment; then the
 experiment will be run. You can of course change all the experiment inputs
 to obtain different results.
 """
-for subject_id in subject_ids:
+# loading epoched signals one subject at a time (on workers processes)
+subjects_epos = load_and_preprocess_subjects(
+    subject_ids=subject_ids,
+    workers=workers,
+    subject_loader=dl_loader,
+    data_dir=data_dir,
+    name_to_start_codes=name_to_start_codes,
+    channel_names=channel_names,
+    resampling_freq=250,  # Schirrmeister: 250
+    clean_ival_ms=ival,  # Schirrmeister: (0, 4000)
+    epoch_ival_ms=ival,  # Schirrmeister: (-500, 4000)
+    train_test_split=True,  # Schirrmeister: True
+    clean_on_all_channels=False,  # Schirrmeister: True
+    standardize_mode=standardize_mode  # Schirrmeister: 2
+)
+
+for subject_id, epo in zip(subject_ids, subjects_epos):
     # creating a log object
     subj_results_dir = create_log(
         results_dir=results_dir,
@@ -92,20 +113,6 @@ for subject_id in subject_ids:
         output_on_file=False
     )
 
-    # loading epoched signal
-    epo = dl_loader(
-        data_dir=data_dir,
-        name_to_start_codes=name_to_start_codes,
-        channel_names=channel_names,
-        subject_id=subject_id,
-        resampling_freq=250,  # Schirrmeister: 250
-        clean_ival_ms=ival,  # Schirrmeister: (0, 4000)
-        epoch_ival_ms=ival,  # Schirrmeister: (-500, 4000)
-        train_test_split=True,  # Schirrmeister: True
-        clean_on_all_channels=False,  # Schirrmeister: True
-        standardize_mode=standardize_mode  # Schirrmeister: 2
-    )
-
     # creating CrossValidation class instance
     cv = CrossValidation(
         X=epo.X,
@@ -45,6 +45,9 @@ random_state = RandomState(1234)
 # setting subject_ids
 subject_ids = (1, 2)  # , 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14)
 
+# setting workers (number of processes loading subjects in parallel)
+workers = 1
+
 # setting hyperparameters
 ival = (-500, 4000)
 standardize_mode = 2
@@ -77,7 +80,8 @@ cross_obj = CrossSubject(data_dir=data_dir,
                          train_test_split=True,
                          clean_ival_ms=ival,
                          epoch_ival_ms=ival,
-                         clean_on_all_channels=False)
+                         clean_on_all_channels=False,
+                         workers=workers)
 
 # parsing all cnt data to epoched (we no more need cnt)
 cross_obj.parser(output_format='epo', parsing_type=1)
@@ -234,19 +234,19 @@ class EEGDataset(object):
         valid_len = int(floor(train_len * validation_frac))
         train_len = train_len - valid_len
 
-        # computing indexes
-        indexes = arange(tot_len)
-        train_indexes = indexes[0:train_len]
-        valid_indexes = indexes[train_len:(train_len + valid_len)]
-        test_indexes = indexes[-test_len:]
+        # computing slices (no index arrays needed, train, valid and test
+        # are contiguous blocks of trials)
+        train_slice = slice(0, train_len)
+        valid_slice = slice(train_len, train_len + valid_len)
+        test_slice = slice(tot_len - test_len, tot_len)
 
         # cutting epo into train, valid & test
-        epo_train_x = epo.X[train_indexes, ...]
-        epo_train_y = epo.y[train_indexes, ...]
-        epo_valid_x = epo.X[valid_indexes, ...]
-        epo_valid_y = epo.y[valid_indexes, ...]
-        epo_test_x = epo.X[test_indexes, ...]
-        epo_test_y = epo.y[test_indexes, ...]
+        epo_train_x = epo.X[train_slice, ...]
+        epo_train_y = epo.y[train_slice, ...]
+        epo_valid_x = epo.X[valid_slice, ...]
+        epo_valid_y = epo.y[valid_slice, ...]
+        epo_test_x = epo.X[test_slice, ...]
+        epo_test_y = epo.y[test_slice, ...]
 
         return EEGDataset(epo_train_x,
                           epo_train_y,
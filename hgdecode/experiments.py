@@ -2,7 +2,6 @@
 import numpy as np
 from numpy import arange
 from numpy import setdiff1d
-from numpy import int as npint
 from pickle import load
 from os.path import join
 from os.path import dirname
@@ -170,7 +169,7 @@ class FBCSPrLDAExperiment(object):
         # computing other properties for further computation
         self.n_classes = len(self.name_to_start_codes)
         self.class_pairs = list(combinations(range(self.n_classes), 2))
-        self.n_trials = self.clean_trial_mask.astype(npint).sum()
+        self.n_trials = int(self.clean_trial_mask.sum())
 
     def create_filter_bank(self):
         self.filterbands = FilterBank(
@@ -204,18 +203,17 @@ class FBCSPrLDAExperiment(object):
         elif self.n_folds == 0:
             self.n_folds = 1
 
-            # creating schirrmeister fold
-            all_idxs = np.array(range(len(self.clean_trial_mask)))
+            # creating schirrmeister fold: last 160 trials are the test
+            # set, first ones the train set (only clean trials)
+            test_start = max(len(self.clean_trial_mask) - 160, 0)
             self.folds = [
                 {
-                    'train': all_idxs[:-160],
-                    'test': all_idxs[-160:]
+                    'train': np.flatnonzero(
+                        self.clean_trial_mask[:test_start]),
+                    'test': np.flatnonzero(
+                        self.clean_trial_mask[test_start:]) + test_start
                 }
             ]
-            self.folds[0]['train'] = self.folds[0]['train'][
-                self.clean_trial_mask[:-160]]
-            self.folds[0]['test'] = self.folds[0]['test'][
-                self.clean_trial_mask[-160:]]
         else:
             # getting pseudo-random folds
             folds = get_balanced_batches(
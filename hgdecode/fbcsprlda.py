@@ -9,6 +9,7 @@ from hgdecode.signalproc import bandpass_mne
 from hgdecode.signalproc import select_trials
 from hgdecode.signalproc import calculate_csp
 from hgdecode.signalproc import select_classes
+from hgdecode.signalproc import select_clean_trials
 from hgdecode.signalproc import apply_csp_var_log
 from hgdecode.signalproc import concatenate_channels
 from braindecode.datautil.iterators import get_balanced_batches
@@ -106,8 +107,7 @@ class BinaryFBCSP(object):
 
             # cleaning epoched data with clean_trial_mask (finally)
             if len(self.folds) != 1:
-                epo.X = epo.X[self.clean_trial_mask]
-                epo.y = epo.y[self.clean_trial_mask]
+                epo = select_clean_trials(epo, self.clean_trial_mask)
 
             # %% CYCLING ON FOLDS
             # %%
@@ -1,36 +1,71 @@
 import logging as log
-from copy import deepcopy
-from numpy import max
-from numpy import abs
-from numpy import sum
-from numpy import std
-from numpy import mean
+from numpy import divide
+from numpy import subtract
 from numpy import array
 from numpy import floor
 from numpy import repeat
 from numpy import arange
+from numpy import delete
 from numpy import setdiff1d
 from numpy import concatenate
 from numpy import count_nonzero
+from numpy import isin
+from numpy import flatnonzero
+from numpy import empty
+from numpy import zeros
+from numpy import maximum
+from numpy import newaxis
+from numpy import float64
+from numpy import s_
+from numpy import __version__ as numpy_version
 from numpy.random import RandomState
+from hashlib import sha1
+from pickle import dump
+from pickle import load
+from pickle import HIGHEST_PROTOCOL
+from os import remove
+from os import replace
+from os import makedirs
+from os import stat
+from os import chmod
+from os import umask
 from os.path import join
+from os.path import dirname
+from os.path import exists
+from tempfile import NamedTemporaryFile
+from functools import partial
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from h5py import File
+from mne import create_info
+from mne import concatenate_raws
+from mne import __version__ as mne_version
 from mne.io.array.array import RawArray
 from hgdecode.utils import print_manager
+from hgdecode.utils import get_available_cpus
 from hgdecode.classes import CrossValidation
+from hgdecode.signalproc import highpass_sos_mne
+from hgdecode.signalproc import resample_poly_mne
+from hgdecode.signalproc import select_clean_trials
+from hgdecode.signalproc import create_signal_target_from_cnt
+from hgdecode.signalproc import get_trial_event_indexes
+from hgdecode.signalproc import ival_ms_to_sample_offsets
+from hgdecode.signalproc import extract_all_start_codes
 from sklearn.model_selection import StratifiedKFold
 from braindecode.datasets.bbci import BBCIDataset
 from braindecode.mne_ext.signalproc import mne_apply
-from braindecode.mne_ext.signalproc import resample_cnt
 from braindecode.mne_ext.signalproc import concatenate_raws_with_events
-from braindecode.datautil.signalproc import bandpass_cnt
 from braindecode.datautil.signalproc import exponential_running_standardize
 from braindecode.datautil.signal_target import SignalAndTarget
-from braindecode.datautil.trial_segment import \
-    create_signal_target_from_raw_mne
 
 
 # TODO: re-implement all this functions as an unique class
 
+# version of the pre-processed data saved in cache; increase it every time
+# the pre-processing routine changes its outputs, so old caches are ignored
+CACHE_VERSION = 3
+
 
 def get_data_files_paths(data_dir, subject_id=1, train_test_split=True):
     # compute file name (for both train and test path)
@@ -48,6 +83,98 @@ def get_data_files_paths(data_dir, subject_id=1, train_test_split=True):
     return file_path
 
 
+class BBCIStreamDataset(BBCIDataset):
+    """
+    Same as braindecode BBCIDataset, but each channel is read from the
+    HDF5 file straight into its row of the final (channels, samples)
+    float64 array; the original loader fills a (samples, channels) array
+    and then copies it twice (volt scaling and float64 conversion made
+    by RawArray), needing up to four times the signal size in memory.
+    rdcc_nbytes is the size of the HDF5 chunk cache used while reading.
+    """
+
+    def __init__(self, filename, load_sensor_names=None,
+                 rdcc_nbytes=256 * 1024 * 1024):
+        super(BBCIStreamDataset, self).__init__(
+            filename,
+            load_sensor_names=load_sensor_names
+        )
+        self.rdcc_nbytes = rdcc_nbytes
+
+    def _load_continuous_signal(self):
+        wanted_chan_inds, wanted_sensor_names = self._determine_sensors()
+        fs = self._determine_samplingrate()
+        with File(self.filename, 'r', rdcc_nbytes=self.rdcc_nbytes) as f:
+            samples = int(f['nfo']['T'][0, 0])
+            signal = empty((len(wanted_chan_inds), samples), dtype=float64)
+            for chan_ind_arr, chan_ind_set in enumerate(wanted_chan_inds):
+                # + 1 because matlab/this hdf5-naming logic has 1-based
+                # indexing (ch1, ch2, ...)
+                chan_set = f['ch' + str(chan_ind_set + 1)]
+                # each channel is stored as a 1xN matrix, reading it in
+                # a view of the same shape on the right signal row
+                chan_set.read_direct(
+                    signal[chan_ind_arr].reshape(chan_set.shape)
+                )
+
+        # scale to volt from microvolt (as BBCIDataset does), in place
+        signal *= 1e-6
+
+        # assume we cant know channel type here automatically
+        info = create_info(ch_names=wanted_sensor_names,
+                           sfreq=fs,
+                           ch_types=['eeg'] * len(wanted_chan_inds))
+        return RawArray(signal, info, verbose='WARNING')
+
+    def load_trials_absmax(self, trial_starts, n_trial_samples,
+                           skip_sensor_names=()):
+        """
+        Compute, for each trial, the max absolute value over all wanted
+        channels but skip_sensor_names (e.g. channels already loaded);
+        trial i spans samples from trial_starts[i] to trial_starts[i] +
+        n_trial_samples. Channels are read and reduced one at a time, and
+        of each channel only the trial windows are read, so samples out of
+        the trials are never read and the whole signal is never held in
+        memory.
+        """
+        wanted_chan_inds, wanted_sensor_names = self._determine_sensors()
+        trials_absmax = zeros(len(trial_starts))
+        chan_trials = empty((len(trial_starts), n_trial_samples))
+        with File(self.filename, 'r', rdcc_nbytes=self.rdcc_nbytes) as f:
+            for chan_ind_set, sensor_name in zip(wanted_chan_inds,
+                                                 wanted_sensor_names):
+                if sensor_name in skip_sensor_names:
+                    continue
+
+                # + 1 because of 1-based indexing (see above); each
+                # channel is a 1xN (or Nx1) matrix, reading each trial
+                # window straight into its row of chan_trials
+                chan_set = f['ch' + str(chan_ind_set + 1)]
+                is_row = chan_set.shape[0] == 1
+                for trial, trial_start in zip(chan_trials, trial_starts):
+                    trial_stop = trial_start + n_trial_samples
+                    if is_row:
+                        source_sel = s_[0:1, trial_start:trial_stop]
+                        trial = trial.reshape(1, n_trial_samples)
+                    else:
+                        source_sel = s_[trial_start:trial_stop, 0:1]
+                        trial = trial.reshape(n_trial_samples, 1)
+                    chan_set.read_direct(trial, source_sel=source_sel)
+                update_trials_absmax(trials_absmax, chan_trials)
+
+        # scale to volt from microvolt (as loaded signal)
+        return trials_absmax * 1e-6
+
+
+def update_trials_absmax(trials_absmax, chan_trials):
+    """
+    Update in place trials_absmax with the max absolute value of each
+    trial of a single channel, given as a trials x samples array.
+    """
+    maximum(trials_absmax, chan_trials.max(axis=1), out=trials_absmax)
+    maximum(trials_absmax, -chan_trials.min(axis=1), out=trials_absmax)
+
+
 def load_cnt(file_path, channel_names, clean_on_all_channels=True):
     # if we have to run the cleaning procedure on all channels, putting
     # load_sensor_names to None will assure us the BBCIDataset class will
@@ -56,12 +183,61 @@ def load_cnt(file_path, channel_names, clean_on_all_channels=True):
         channel_names = None
 
     # create the loader object for BBCI standard
-    loader = BBCIDataset(file_path, load_sensor_names=channel_names)
+    loader = BBCIStreamDataset(file_path, load_sensor_names=channel_names)
 
     # load data
     return loader.load()
 
 
+def get_cache_file_path(cache_dir, file_paths, **kwargs):
+    """
+    Compute the path of the cache file for preprocessed data; the file
+    name is an hash of CACHE_VERSION, of the mne and numpy versions
+    (cache files are pickled RawArrays), of the data file paths with their
+    size and modification time and of all the pre-processing parameters
+    given as kwargs, so different configurations, modified data files, a
+    changed pre-processing routine or upgraded libraries will never share
+    the same cache file.
+    """
+    files_info = [
+        (file_path, stat(file_path).st_size, stat(file_path).st_mtime_ns)
+        for file_path in file_paths
+    ]
+    config = repr((CACHE_VERSION, mne_version, numpy_version, files_info,
+                   sorted(kwargs.items())))
+    return join(cache_dir, sha1(config.encode()).hexdigest() + '.pickle')
+
+
+def save_cache_file(cache_file_path, outputs):
+    """
+    Pickle outputs in cache_file_path; data are written in a temporary
+    file in the same directory which is then moved to cache_file_path, so
+    an interrupted run can never leave a truncated cache file. The cache
+    file gets the default permissions of a new file (the temporary one is
+    created readable only by its owner), so a shared cache_dir stays
+    readable by other users.
+    """
+    cache_dir = dirname(cache_file_path)
+
+    # exist_ok since subjects can be loaded in parallel processes
+    makedirs(cache_dir, exist_ok=True)
+    with NamedTemporaryFile(dir=cache_dir, suffix='.tmp',
+                            delete=False) as f:
+        temp_file_path = f.name
+        try:
+            dump(outputs, f, protocol=HIGHEST_PROTOCOL)
+        except BaseException:
+            f.close()
+            remove(temp_file_path)
+            raise
+
+    # umask can only be read by setting it, so restoring it straight away
+    current_umask = umask(0)
+    umask(current_umask)
+    chmod(temp_file_path, 0o666 & ~current_umask)
+    replace(temp_file_path, cache_file_path)
+
+
 def get_clean_trial_mask(cnt, name_to_start_codes, clean_ival_ms=(0, 4000)):
     """
     Scan trial in continuous data and create a mask with only the
@@ -70,76 +246,169 @@ def get_clean_trial_mask(cnt, name_to_start_codes, clean_ival_ms=(0, 4000)):
     the original not valid data.
     """
     # split cnt into trials data for cleaning
-    set_for_cleaning = create_signal_target_from_raw_mne(
+    set_for_cleaning = create_signal_target_from_cnt(
         cnt,
         name_to_start_codes,
         clean_ival_ms
     )
 
     # compute the clean_trial_mask: in this case we take only all
-    # trials that have absolute microvolt values larger than +- 800
-    clean_trial_mask = max(abs(set_for_cleaning.X), axis=(1, 2)) < 800
+    # trials that have absolute microvolt values larger than +- 800;
+    # checking max and min separately is the same as checking max(abs(X))
+    # but it does not allocate an abs(X) temporary as big as X
+    X = set_for_cleaning.X
+    clean_trial_mask = \
+        (X.max(axis=(1, 2)) < 800) & (X.min(axis=(1, 2)) > -800)
 
     # logging clean trials information
-    log.info(
-        'Clean trials: {:3d}  of {:3d} ({:5.1f}%)'.format(
-            sum(clean_trial_mask),
-            len(set_for_cleaning.X),
-            mean(clean_trial_mask) * 100)
+    log_clean_trials(clean_trial_mask)
+
+    # return the clean_trial_mask
+    return clean_trial_mask
+
+
+def get_clean_trial_mask_all_channels(file_path,
+                                      cnt,
+                                      name_to_start_codes,
+                                      clean_ival_ms=(0, 4000)):
+    """
+    Same as get_clean_trial_mask, but trials are checked on all the
+    channels in file_path while cnt needs only the wanted ones; channels
+    already in cnt are checked on its data, all the others are streamed
+    from file one at a time (reading only the trial windows), so all
+    channels are never loaded together and no channel is read twice.
+    """
+    # getting trials first samples (the same of epoching)
+    start_offset, stop_offset = ival_ms_to_sample_offsets(
+        clean_ival_ms,
+        cnt.info['sfreq']
     )
+    trial_event_indexes = get_trial_event_indexes(
+        cnt,
+        name_to_start_codes,
+        clean_ival_ms
+    )
+    trial_starts = cnt.info['events'][trial_event_indexes, 0] + start_offset
+
+    n_trial_samples = stop_offset - start_offset
+
+    # max absolute value of each trial on channels not in cnt (from file)
+    loader = BBCIStreamDataset(file_path, load_sensor_names=None)
+    trials_absmax = loader.load_trials_absmax(
+        trial_starts,
+        n_trial_samples,
+        skip_sensor_names=set(cnt.ch_names)
+    )
+
+    # updating it with channels already in cnt (already scaled to volt)
+    trial_samples = trial_starts[:, newaxis] + arange(n_trial_samples)
+    for chan_signal in cnt._data:
+        update_trials_absmax(trials_absmax, chan_signal[trial_samples])
+
+    # compute the clean_trial_mask (same threshold of get_clean_trial_mask)
+    clean_trial_mask = trials_absmax < 800
+
+    # logging clean trials information
+    log_clean_trials(clean_trial_mask)
 
     # return the clean_trial_mask
     return clean_trial_mask
 
 
+def log_clean_trials(clean_trial_mask):
+    log.info(
+        'Clean trials: {:3d}  of {:3d} ({:5.1f}%)'.format(
+            count_nonzero(clean_trial_mask),
+            len(clean_trial_mask),
+            clean_trial_mask.mean() * 100)
+    )
+
+
+def remove_dirty_trial_events(cnt, clean_trial_mask, name_to_start_codes,
+                              clean_ival_ms=(0, 4000)):
+    """
+    Remove from cnt events all the trials that are not valid for
+    clean_trial_mask; in this way, epoching the returned cnt, only clean
+    trials will be created and there will not be any need to clean the
+    epoched signal with the mask.
+    """
+    # getting events of trials (the same that were used for the mask)
+    trial_event_indexes = get_trial_event_indexes(
+        cnt,
+        name_to_start_codes,
+        clean_ival_ms
+    )
+
+    # deleting events of not valid trials
+    cnt.info['events'] = delete(
+        cnt.info['events'],
+        trial_event_indexes[~clean_trial_mask],
+        axis=0
+    )
+    return cnt
+
+
+def remove_out_of_bounds_trial_events(cnt, name_to_start_codes,
+                                      clean_ival_ms=(0, 4000)):
+    """
+    Remove from cnt events the trials whose clean interval does not fall
+    inside cnt (so they are not epoched and not in the clean_trial_mask
+    of this cnt); cnt of different files are later concatenated, and
+    without this a trial at the end (or at the beginning) of a file could
+    have a valid interval in the concatenated cnt, giving one more epoch
+    than mask values and misaligning all the trials after it.
+    """
+    # getting events of all trials and of the valid ones
+    events = cnt.info['events']
+    start_code_indexes = flatnonzero(
+        isin(events[:, 2], extract_all_start_codes(name_to_start_codes))
+    )
+    trial_event_indexes = get_trial_event_indexes(
+        cnt,
+        name_to_start_codes,
+        clean_ival_ms
+    )
+
+    # deleting events of trials out of bounds
+    cnt.info['events'] = delete(
+        events,
+        setdiff1d(start_code_indexes, trial_event_indexes),
+        axis=0
+    )
+    return cnt
+
+
 def pick_right_channels(cnt, channel_names):
     # return the same cnt but with only right channels
     return cnt.pick_channels(channel_names)
 
 
-def standardize_cnt(cnt, standardize_mode=0):
-    # computing frequencies
-    sampling_freq = cnt.info['sfreq']
-    init_freq = 0.1
-    stop_freq = sampling_freq / 2 - 0.1
-    filt_order = 3
-    axis = 0
-    filtfilt = False
-
-    # filtering DC and frequencies higher than the nyquist one
-    cnt = mne_apply(
-        lambda x:
-        bandpass_cnt(
-            data=x,
-            low_cut_hz=init_freq,
-            high_cut_hz=stop_freq,
-            fs=sampling_freq,
-            filt_order=filt_order,
-            axis=axis,
-            filtfilt=filtfilt
-        ),
-        cnt
+def standardize_cnt(cnt, standardize_mode=0, workers=None):
+    # filtering DC; since the band goes up to the nyquist frequency only
+    # a high-pass filter is needed (standardize_mode 0 is only this
+    # filtering). The causal filter starts each channel from the steady
+    # state of its first sample, so the channel offset does not hit it as
+    # a step leaving a transient of seconds at the beginning of the signal
+    cnt = highpass_sos_mne(
+        cnt,
+        low_cut_hz=0.1,
+        filt_order=3,
+        filtfilt=False,
+        workers=workers
     )
 
-    # removing mean and normalizing in 3 different ways
-    if standardize_mode == 0:
-        # x - mean
-        cnt = mne_apply(
-            lambda x:
-            x - mean(x, axis=0, keepdims=True),
-            cnt
-        )
-    elif standardize_mode == 1:
+    # normalizing in 2 different ways; cnt was just created by the
+    # filtering step, so its data can be changed in place without
+    # allocating a new array for each operation (data are channels x
+    # time, so mean and std are computed along time)
+    data = cnt._data
+    if standardize_mode == 1:
         # (x - mean) / std
-        cnt = mne_apply(
-            lambda x:
-            (x - mean(x, axis=0, keepdims=True)) /
-            std(x, axis=0, keepdims=True),
-            cnt
-        )
+        subtract(data, data.mean(axis=1, keepdims=True), out=data)
+        divide(data, data.std(axis=1, keepdims=True), out=data)
     elif standardize_mode == 2:
         # parsing to milli volt for numerical stability of next operations
-        cnt = mne_apply(lambda a: a * 1e6, cnt)
+        data *= 1e6
 
         # applying exponential_running_standardize (Schirrmeister)
         cnt = mne_apply(
@@ -155,6 +424,157 @@ def standardize_cnt(cnt, standardize_mode=0):
     return cnt
 
 
+def load_and_clean_cnt(file_path,
+                       name_to_start_codes,
+                       channel_names,
+                       clean_ival_ms=(0, 4000),
+                       clean_on_all_channels=True,
+                       remove_dirty_trials=False):
+    """
+    Load a single BBCI file, get its clean_trial_mask, remove dirty
+    trials events (if required) and events of trials out of the file
+    bounds, and pick only right channels; returns both the cnt and the
+    mask.
+    """
+    # loading continuous data (only right channels: if the cleaning has
+    # to be run on all channels, they will be streamed from file only
+    # for the cleaning step)
+    cnt = load_cnt(file_path=file_path,
+                   channel_names=channel_names,
+                   clean_on_all_channels=False)
+
+    # getting clean_trial_mask
+    if clean_on_all_channels is True:
+        clean_trial_mask = get_clean_trial_mask_all_channels(
+            file_path=file_path,
+            cnt=cnt,
+            name_to_start_codes=name_to_start_codes,
+            clean_ival_ms=clean_ival_ms
+        )
+    else:
+        clean_trial_mask = get_clean_trial_mask(
+            cnt=cnt,
+            name_to_start_codes=name_to_start_codes,
+            clean_ival_ms=clean_ival_ms
+        )
+
+    # removing not valid trials from events, if required
+    if remove_dirty_trials:
+        cnt = remove_dirty_trial_events(
+            cnt=cnt,
+            clean_trial_mask=clean_trial_mask,
+            name_to_start_codes=name_to_start_codes,
+            clean_ival_ms=clean_ival_ms
+        )
+
+    # removing trials out of this file bounds (they are not in the mask)
+    cnt = remove_out_of_bounds_trial_events(
+        cnt=cnt,
+        name_to_start_codes=name_to_start_codes,
+        clean_ival_ms=clean_ival_ms
+    )
+
+    # pick only right channels
+    cnt = pick_right_channels(cnt, channel_names)
+    return cnt, clean_trial_mask
+
+
+def preprocess_cnt(cnt, resampling_freq=None, standardize_mode=None,
+                   workers=None):
+    # workers is the number of threads used for filtering (if None, all
+    # cpu available to the process)
+    # resample continuous data
+    if resampling_freq is not None:
+        log.info('Resampling continuous data...')
+        cnt = resample_poly_mne(
+            cnt,
+            resampling_freq
+        )
+        print_manager('DONE!!', bottom_return=1)
+
+    # standardize continuous data
+    if standardize_mode is not None:
+        log.info('Standardizing continuous data...')
+        log.info('Standardize mode: {}'.format(standardize_mode))
+        cnt = standardize_cnt(cnt=cnt,
+                              standardize_mode=standardize_mode,
+                              workers=workers)
+        print_manager('DONE!!', 'last', bottom_return=1)
+    return cnt
+
+
+def load_and_preprocess_cnt(file_path,
+                            resampling_freq=None,
+                            standardize_mode=None,
+                            workers=None,
+                            **kwargs):
+    """
+    Run load_and_clean_cnt and then preprocess_cnt on a single file; all
+    others kwargs are passed to load_and_clean_cnt.
+    """
+    cnt, clean_trial_mask = load_and_clean_cnt(file_path, **kwargs)
+    cnt = preprocess_cnt(cnt,
+                         resampling_freq=resampling_freq,
+                         standardize_mode=standardize_mode,
+                         workers=workers)
+    return cnt, clean_trial_mask
+
+
+def get_cache_config(name_to_start_codes,
+                     channel_names,
+                     resampling_freq,
+                     clean_ival_ms,
+                     clean_on_all_channels,
+                     standardize_mode,
+                     merge_files):
+    """
+    Return, as a dict, all the parameters that change the outputs of
+    load_and_preprocess_data (merge_files=True) or of
+    load_and_preprocess_files (merge_files=False); both of them key their
+    cache file on this dict, so the two keys can not drift apart.
+    """
+    return dict(name_to_start_codes=name_to_start_codes,
+                channel_names=channel_names,
+                resampling_freq=resampling_freq,
+                clean_ival_ms=clean_ival_ms,
+                clean_on_all_channels=clean_on_all_channels,
+                standardize_mode=standardize_mode,
+                merge_files=merge_files)
+
+
+def load_cache_file(cache_dir, file_paths, **kwargs):
+    """
+    Return the cache file path of file_paths pre-processed with kwargs
+    configuration and the outputs already saved in it, or None as outputs
+    if these data were never pre-processed with this configuration.
+    """
+    cache_file_path = get_cache_file_path(cache_dir, file_paths, **kwargs)
+    if not exists(cache_file_path):
+        return cache_file_path, None
+    print_manager('Loading pre-processed data from cache...')
+    with open(cache_file_path, 'rb') as f:
+        outputs = load(f)
+    print_manager('DONE!!', 'last', bottom_return=1)
+    return cache_file_path, outputs
+
+
+def load_files(file_loader, file_paths):
+    """
+    Run file_loader on each file on a pool of threads; map gives outputs
+    back in the same order of file_paths, so a list of cnts and a list of
+    clean_trial_masks are returned. h5py runs every HDF5 call under one
+    global lock, so files are never read at the same time: threads only
+    let the NumPy work of a file (the cleaning and, if files are not
+    merged, filtering and resampling) overlap with the reads of the other.
+    """
+    print_manager('Loading and cleaning continuous data...')
+    with ThreadPoolExecutor(max_workers=len(file_paths)) as executor:
+        outputs = list(executor.map(file_loader, file_paths))
+    cnts = [cnt for cnt, _ in outputs]
+    masks = [mask for _, mask in outputs]
+    return cnts, masks
+
+
 def load_and_preprocess_data(data_dir,
                              name_to_start_codes,
                              channel_names,
@@ -163,7 +583,9 @@ def load_and_preprocess_data(data_dir,
                              clean_ival_ms=(0, 4000),
                              train_test_split=True,
                              clean_on_all_channels=True,
-                             standardize_mode=None):
+                             standardize_mode=None,
+                             cache_dir=None,
+                             workers=None):
     # TODO: create here another get_data_files_paths function if you have a
     #  different file configuration; in every case, file_paths must be a
     #  list of paths to valid BBCI standard files
@@ -177,58 +599,144 @@ def load_and_preprocess_data(data_dir,
     # starting the loading routine
     print_manager('DATA LOADING ROUTINE FOR SUBJ ' + str(subject_id),
                   'double-dashed')
-    print_manager('Loading continuous data...')
-
-    # pre-allocating main cnt
-    cnt = None
-
-    # loading files and merging them
-    for idx, current_path in enumerate(file_paths):
-        current_cnt = load_cnt(file_path=current_path,
-                               channel_names=channel_names,
-                               clean_on_all_channels=clean_on_all_channels)
-        # if the path is the first one...
-        if idx is 0:
-            # ...copying current_cnt as the main one, else...
-            cnt = deepcopy(current_cnt)
-        else:
-            # merging current_cnt with the main one
-            cnt = concatenate_raws_with_events([cnt, current_cnt])
-    print_manager('DONE!!', bottom_return=1)
 
-    # getting clean_trial_mask
-    print_manager('Getting clean trial mask...')
-    clean_trial_mask = get_clean_trial_mask(
-        cnt=cnt,
-        name_to_start_codes=name_to_start_codes,
-        clean_ival_ms=clean_ival_ms
+    # if a cache directory is given and these data were already
+    # pre-processed with the same configuration, skipping all the routine
+    cache_file_path = None
+    if cache_dir is not None:
+        cache_file_path, outputs = load_cache_file(
+            cache_dir,
+            file_paths,
+            **get_cache_config(
+                name_to_start_codes=name_to_start_codes,
+                channel_names=channel_names,
+                resampling_freq=resampling_freq,
+                clean_ival_ms=clean_ival_ms,
+                clean_on_all_channels=clean_on_all_channels,
+                standardize_mode=standardize_mode,
+                merge_files=True
+            )
+        )
+        if outputs is not None:
+            return outputs
+
+    # loading, cleaning and picking each file on its own thread
+    cnts, masks = load_files(
+        partial(load_and_clean_cnt,
+                name_to_start_codes=name_to_start_codes,
+                channel_names=channel_names,
+                clean_ival_ms=clean_ival_ms,
+                clean_on_all_channels=clean_on_all_channels),
+        file_paths
     )
-    print_manager('DONE!!', bottom_return=1)
 
-    # pick only right channels
-    log.info('Picking only right channels...')
-    cnt = pick_right_channels(cnt, channel_names)
+    # merging loaded files and their masks; files were just loaded and are
+    # not shared, so they are concatenated in place into the first one
+    # (concatenate_raws_with_events would deepcopy it)
+    cnt, events = concatenate_raws(
+        cnts,
+        events_list=[current_cnt.info['events'] for current_cnt in cnts]
+    )
+    cnt.info['events'] = events
+    clean_trial_mask = concatenate(masks)
+
+    # dropping the references to single files cnt, so their memory is
+    # released now and not at the end of the whole routine
+    del cnts
     print_manager('DONE!!', bottom_return=1)
 
-    # resample continuous data
-    if resampling_freq is not None:
-        log.info('Resampling continuous data...')
-        cnt = resample_cnt(
-            cnt,
-            resampling_freq
-        )
-        print_manager('DONE!!', bottom_return=1)
+    # resampling and standardizing merged data
+    cnt = preprocess_cnt(cnt,
+                         resampling_freq=resampling_freq,
+                         standardize_mode=standardize_mode,
+                         workers=workers)
 
-    # standardize continuous data
-    if standardize_mode is not None:
-        log.info('Standardizing continuous data...')
-        log.info('Standardize mode: {}'.format(standardize_mode))
-        cnt = standardize_cnt(cnt=cnt, standardize_mode=standardize_mode)
-        print_manager('DONE!!', 'last', bottom_return=1)
+    # saving pre-processed data for next runs
+    if cache_file_path is not None:
+        save_cache_file(cache_file_path, (cnt, clean_trial_mask))
 
     return cnt, clean_trial_mask
 
 
+def load_and_preprocess_files(data_dir,
+                              name_to_start_codes,
+                              channel_names,
+                              subject_id=1,
+                              resampling_freq=None,
+                              clean_ival_ms=(0, 4000),
+                              train_test_split=True,
+                              clean_on_all_channels=True,
+                              standardize_mode=None,
+                              cache_dir=None,
+                              workers=None):
+    """
+    Same routine of load_and_preprocess_data, but each file is resampled
+    and standardized on its own (in parallel) instead of being merged with
+    the others, and not valid trials are removed from its events: a list
+    of cnts, one for each file, is returned, so continuous data never need
+    to be concatenated and can be epoched straight away (masks are not
+    returned, since they would not match the trials left in cnts).
+    workers is the number of filtering threads shared by all files (if
+    None, all cpu available to the process).
+    """
+    # getting data paths
+    file_paths = get_data_files_paths(
+        data_dir,
+        subject_id=subject_id,
+        train_test_split=train_test_split
+    )
+
+    # starting the loading routine
+    print_manager('DATA LOADING ROUTINE FOR SUBJ ' + str(subject_id),
+                  'double-dashed')
+
+    # if a cache directory is given and these data were already
+    # pre-processed with the same configuration, skipping all the routine
+    cache_file_path = None
+    if cache_dir is not None:
+        cache_file_path, outputs = load_cache_file(
+            cache_dir,
+            file_paths,
+            **get_cache_config(
+                name_to_start_codes=name_to_start_codes,
+                channel_names=channel_names,
+                resampling_freq=resampling_freq,
+                clean_ival_ms=clean_ival_ms,
+                clean_on_all_channels=clean_on_all_channels,
+                standardize_mode=standardize_mode,
+                merge_files=False
+            )
+        )
+        if outputs is not None:
+            return outputs
+
+    # loading, cleaning, picking and pre-processing each file on its own
+    # thread, splitting filtering threads among files, so that they do
+    # not run more threads than the available cpu
+    if workers is None:
+        workers = get_available_cpus()
+    file_workers = max(workers // len(file_paths), 1)
+    cnts, _ = load_files(
+        partial(load_and_preprocess_cnt,
+                name_to_start_codes=name_to_start_codes,
+                channel_names=channel_names,
+                clean_ival_ms=clean_ival_ms,
+                clean_on_all_channels=clean_on_all_channels,
+                remove_dirty_trials=True,
+                resampling_freq=resampling_freq,
+                standardize_mode=standardize_mode,
+                workers=file_workers),
+        file_paths
+    )
+    print_manager('DONE!!', bottom_return=1)
+
+    # saving pre-processed data for next runs
+    if cache_file_path is not None:
+        save_cache_file(cache_file_path, cnts)
+
+    return cnts
+
+
 def ml_loader(data_dir,
               name_to_start_codes,
               channel_names,
@@ -237,7 +745,9 @@ def ml_loader(data_dir,
               clean_ival_ms=(0, 4000),
               train_test_split=True,
               clean_on_all_channels=True,
-              standardize_mode=None):
+              standardize_mode=None,
+              cache_dir=None,
+              workers=None):
     outputs = load_and_preprocess_data(
         data_dir=data_dir,
         name_to_start_codes=name_to_start_codes,
@@ -247,11 +757,60 @@ def ml_loader(data_dir,
         clean_ival_ms=clean_ival_ms,
         train_test_split=train_test_split,
         clean_on_all_channels=clean_on_all_channels,
-        standardize_mode=standardize_mode
+        standardize_mode=standardize_mode,
+        cache_dir=cache_dir,
+        workers=workers
     )
     return outputs[0], outputs[1]
 
 
+def _load_subject(subject_id, subject_loader, **kwargs):
+    # module level wrapper, so it can be pickled and sent to workers
+    return subject_loader(subject_id=subject_id, **kwargs)
+
+
+def load_and_preprocess_subjects(subject_ids, workers=1,
+                                 subject_loader=None, **kwargs):
+    """
+    Run subject_loader (load_and_preprocess_data if None, or e.g.
+    ml_loader or dl_loader) on each subject in subject_ids; since each
+    subject pipeline is independent, if workers is greater than 1
+    subjects will be processed in parallel on a pool of processes. All
+    others kwargs are passed to subject_loader. This is a generator:
+    outputs are yielded one subject at a time, in the same order of
+    subject_ids, and at most workers subjects are being loaded (or
+    waiting to be consumed) at the same time, so the caller can use (or
+    merge) each subject as it arrives, while the next ones are loaded,
+    without holding all of them in memory. Available cpu are split among
+    processes for filtering threads.
+    """
+    if subject_loader is None:
+        subject_loader = load_and_preprocess_data
+
+    # if workers is None, using all available cpu
+    cpus = get_available_cpus()
+    if workers is None:
+        workers = cpus
+    workers = max(min(workers, len(subject_ids)), 1)
+
+    loader = partial(_load_subject,
+                     subject_loader=subject_loader,
+                     workers=max(cpus // workers, 1),
+                     **kwargs)
+    if workers <= 1:
+        for subject_id in subject_ids:
+            yield loader(subject_id)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = deque()
+        for subject_id in subject_ids:
+            futures.append(executor.submit(loader, subject_id))
+            if len(futures) == workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
 def dl_loader(data_dir,
               name_to_start_codes,
               channel_names,
@@ -261,9 +820,11 @@ def dl_loader(data_dir,
               epoch_ival_ms=(-500, 4000),
               train_test_split=True,
               clean_on_all_channels=True,
-              standardize_mode=0):
+              standardize_mode=0,
+              cache_dir=None,
+              workers=None):
     # loading and pre-processing data
-    cnt, clean_trial_mask = load_and_preprocess_data(
+    cnts = load_and_preprocess_files(
         data_dir=data_dir,
         name_to_start_codes=name_to_start_codes,
         channel_names=channel_names,
@@ -272,23 +833,25 @@ def dl_loader(data_dir,
         clean_ival_ms=clean_ival_ms,
         train_test_split=train_test_split,
         clean_on_all_channels=clean_on_all_channels,
-        standardize_mode=standardize_mode
+        standardize_mode=standardize_mode,
+        cache_dir=cache_dir,
+        workers=workers
     )
-    print_manager('EPOCHING AND CLEANING WITH MASK', 'double-dashed')
-
-    # epoching continuous data (from RawArray to SignalAndTarget)
+    print_manager('EPOCHING', 'double-dashed')
+
+    # epoching continuous data (from RawArray to SignalAndTarget); not
+    # valid trials were already removed from cnt events, so only clean
+    # trials will be epoched, directly in a float32 array (as networks
+    # are trained in float32). Trials of all files are copied, in file
+    # order, into the same array, so continuous data are never
+    # concatenated
     print_manager('Epoching...')
-    epo = create_signal_target_from_raw_mne(
-        cnt,
+    epo = create_signal_target_from_cnt(
+        cnts,
         name_to_start_codes,
         epoch_ival_ms
     )
-    print_manager('DONE!!', bottom_return=1)
-
-    # cleaning epoched signal with mask
-    print_manager('cleaning with mask...')
-    epo.X = epo.X[clean_trial_mask]
-    epo.y = epo.y[clean_trial_mask]
+    del cnts
     print_manager('DONE!!', 'last', bottom_return=1)
 
     # returning only the epoched signal
@@ -317,7 +880,9 @@ class CrossSubject(object):
                  train_test_split=True,
                  clean_ival_ms=(-500, 4000),
                  epoch_ival_ms=(-500, 4000),
-                 clean_on_all_channels=True):
+                 clean_on_all_channels=True,
+                 workers=1,
+                 cache_dir=None):
         # from input properties
         self.data_dir = data_dir
         self.subject_ids = subject_ids
@@ -346,55 +911,29 @@ class CrossSubject(object):
         self.fold_data = None
         self.fold_subject_labels = None
 
-        # loading the first subject (to pre-allocate cnt array)
-        # we are gonna pass standardize_mode=None, so the loading procedure
-        # will not standardize data. They will be standardized at the very
-        # end, when all data are loaded
-        temp_cnt, temp_mask = load_and_preprocess_data(
+        # loading all subjects cnt data and masks (in parallel if more
+        # than one worker is available), they are merged below one at a
+        # time as soon as they are loaded; we are gonna pass
+        # standardize_mode=None, so the loading procedure will not
+        # standardize data. They will be standardized at the very end,
+        # when all data are loaded
+        subjects_outputs = load_and_preprocess_subjects(
+            subject_ids=self.subject_ids,
+            workers=workers,
             data_dir=self.data_dir,
             name_to_start_codes=self.name_to_start_codes,
             channel_names=self.channel_names,
-            subject_id=self.subject_ids[0],
             resampling_freq=self.resampling_freq,
             clean_ival_ms=self.clean_ival_ms,
             train_test_split=self.train_test_split,
             clean_on_all_channels=self.clean_on_all_channels,
-            standardize_mode=None
-        )
-
-        # allocate the first subject_labels
-        temp_labels = repeat(array([subject_ids[0]]), len(temp_mask))
-
-        # appending new indexes (only cleaned cnt will count!)
-        last_non_zero_len = count_nonzero(self.clean_trial_mask)
-        self.subject_indexes.append(
-            [last_non_zero_len, last_non_zero_len + count_nonzero(temp_mask)]
+            standardize_mode=None,
+            cache_dir=cache_dir
         )
 
-        # merging cnt, mask and labels (in this case assigning)
-        self.data = temp_cnt
-        self.clean_trial_mask = temp_mask
-        self.subject_labels = temp_labels
-
-        # creating iterable object from subject_ids and skipping the first one
-        iter_subjects = iter(self.subject_ids)
-        next(iter_subjects)
-
-        # loading all others cnt data and concatenating them
-        for current_subject in iter_subjects:
-            # loading current subject cnt and mask
-            temp_cnt, temp_mask = load_and_preprocess_data(
-                subject_id=current_subject,  # here the current subject!
-                data_dir=self.data_dir,
-                name_to_start_codes=self.name_to_start_codes,
-                channel_names=self.channel_names,
-                resampling_freq=self.resampling_freq,
-                clean_ival_ms=self.clean_ival_ms,
-                train_test_split=self.train_test_split,
-                clean_on_all_channels=self.clean_on_all_channels,
-                standardize_mode=None
-            )
-
+        # merging all cnt data, masks and labels
+        for current_subject, (temp_cnt, temp_mask) in \
+                zip(self.subject_ids, subjects_outputs):
             # create the subject_labels for this subject
             temp_labels = repeat(array([current_subject]), len(temp_mask))
 
@@ -405,12 +944,17 @@ class CrossSubject(object):
                  last_non_zero_len + count_nonzero(temp_mask)]
             )
 
-            # merging cnt and mask
-            self.data = concatenate_raws_with_events([self.data, temp_cnt])
-            self.clean_trial_mask = \
-                concatenate([self.clean_trial_mask, temp_mask])
-            self.subject_labels = \
-                concatenate([self.subject_labels, temp_labels])
+            # merging cnt, mask and labels (assigning if first subject)
+            if self.data is None:
+                self.data = temp_cnt
+                self.clean_trial_mask = temp_mask
+                self.subject_labels = temp_labels
+            else:
+                self.data = concatenate_raws_with_events([self.data, temp_cnt])
+                self.clean_trial_mask = \
+                    concatenate([self.clean_trial_mask, temp_mask])
+                self.subject_labels = \
+                    concatenate([self.subject_labels, temp_labels])
 
         # computing validation_frac and validation_size
         if validation_size is None:
@@ -453,7 +997,7 @@ class CrossSubject(object):
             if parsing_type == 0:
                 # parsing from cnt to epoch
                 print_manager('Parsing cnt signal to epoched one...')
-                self.fold_data = create_signal_target_from_raw_mne(
+                self.fold_data = create_signal_target_from_cnt(
                     self.data,
                     self.name_to_start_codes,
                     self.epoch_ival_ms
@@ -462,8 +1006,8 @@ class CrossSubject(object):
 
                 # cleaning signal and labels with mask
                 print_manager('Cleaning epoched signal with mask...')
-                self.fold_data.X = self.fold_data.X[self.clean_trial_mask]
-                self.fold_data.y = self.fold_data.y[self.clean_trial_mask]
+                self.fold_data = select_clean_trials(self.fold_data,
+                                                     self.clean_trial_mask)
                 self.fold_subject_labels = \
                     self.subject_labels[self.clean_trial_mask]
                 print_manager('DONE!!', bottom_return=1)
@@ -475,7 +1019,7 @@ class CrossSubject(object):
                 the original one in the data property
                 """
                 print_manager('Parsing cnt signal to epoched one...')
-                self.data = create_signal_target_from_raw_mne(
+                self.data = create_signal_target_from_cnt(
                     self.data,
                     self.name_to_start_codes,
                     self.epoch_ival_ms
@@ -484,8 +1028,8 @@ class CrossSubject(object):
 
                 # cleaning signal and labels
                 print_manager('Cleaning epoched signal with mask...')
-                self.data.X = self.data.X[self.clean_trial_mask]
-                self.data.y = self.data.y[self.clean_trial_mask]
+                self.data = select_clean_trials(self.data,
+                                                self.clean_trial_mask)
                 self.subject_labels = \
                     self.subject_labels[self.clean_trial_mask]
                 print_manager('DONE!!', bottom_return=1)
@@ -582,11 +1126,10 @@ class CrossSubject(object):
     def _get_subject_data(self, subj_idx):
         init = self.subject_indexes[subj_idx][0]
         stop = self.subject_indexes[subj_idx][1]
-        ival = arange(init, stop)
         if isinstance(self.fold_data, SignalAndTarget):
-            return self.fold_data.X[ival], self.fold_data.y[ival]
+            return self.fold_data.X[init:stop], self.fold_data.y[init:stop]
         elif isinstance(self.data, SignalAndTarget):
-            return self.data.X[ival], self.data.y[ival]
+            return self.data.X[init:stop], self.data.y[init:stop]
         else:
             raise ValueError('You are trying to get epoched data but you '
                              'still have to parse cnt data.')
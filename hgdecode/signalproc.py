@@ -1,24 +1,266 @@
+import logging as log
+from math import ceil
 from copy import deepcopy
+from functools import lru_cache
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import scipy as sp
-
+from scipy.signal import butter
+from scipy.signal import sosfilt
+from scipy.signal import sosfilt_zi
+from scipy.signal import sosfiltfilt
+from scipy.signal import resample_poly
+from mne.io import RawArray
+
+from hgdecode.utils import get_available_cpus
 from braindecode.datautil.signal_target import SignalAndTarget
-from braindecode.datautil.signalproc import bandpass_cnt
 from braindecode.mne_ext.signalproc import mne_apply
 
 
-def bandpass_mne(cnt, low_cut_hz, high_cut_hz, filt_order=3, axis=0):
-    return mne_apply(lambda data: bandpass_cnt(
-        data.T, low_cut_hz, high_cut_hz, fs=cnt.info['sfreq'],
-        filt_order=filt_order, axis=axis).T,
-                     cnt)
+@lru_cache(maxsize=32)
+def design_butter_sos(low_cut_hz, high_cut_hz, fs, filt_order=3):
+    """Design a Butterworth filter in SOS form, caching the result.
+
+    Filters are designed again and again with the same parameters (once
+    per subject, or once per filter band and fold), so the second-order
+    sections are cached by (low_cut_hz, high_cut_hz, fs, filt_order).
+
+    Parameters
+    ----------
+    low_cut_hz : float or None
+        low cut frequency; if None or 0 a low-pass filter is designed
+    high_cut_hz : float or None
+        high cut frequency; if None a high-pass filter is designed
+    fs : float
+        sampling frequency
+    filt_order : int
+        order of the Butterworth filter
+
+    Returns
+    -------
+    sos : 2d array
+        second-order sections of the filter (shared by all callers
+        with the same parameters, so it is read-only)
+    """
+    nyq_freq = fs / 2.0
+    if high_cut_hz is None:
+        sos = butter(filt_order, low_cut_hz / nyq_freq, btype='highpass',
+                     output='sos')
+    elif low_cut_hz is None or low_cut_hz == 0:
+        sos = butter(filt_order, high_cut_hz / nyq_freq, btype='lowpass',
+                     output='sos')
+    else:
+        sos = butter(filt_order, [low_cut_hz / nyq_freq,
+                                  high_cut_hz / nyq_freq],
+                     btype='bandpass', output='sos')
+    sos.setflags(write=False)
+    return sos
+
+
+def sosfilt_channels(sos, data, filtfilt=False, workers=None):
+    """Apply a SOS filter along time to each channel, in parallel.
+
+    Channels are filtered independently, so they are split in one chunk
+    per worker and each chunk is filtered on its own thread (scipy
+    filtering loops release the GIL) directly into the output array. The
+    causal filter starts each channel from the steady state of its first
+    sample (as if the signal had always been at that value), so the DC
+    offset of the channel does not hit the filter as a step at sample 0.
+
+    Parameters
+    ----------
+    sos : 2d array
+        second-order sections of the filter
+    data : 2d array
+        signal in the form channels x time
+    filtfilt : bool
+        if True the filter is applied forward and backward (zero phase),
+        else only forward (causal)
+    workers : int, optional
+        number of threads; if None all cpu available to the process are
+        used
+
+    Returns
+    -------
+    filtered : 2d array
+        filtered signal, with the same shape of data
+    """
+    # scipy filtering kernels take a writable buffer, while designs from
+    # design_butter_sos are read-only (copying a few sections is free)
+    sos = np.array(sos)
+    if filtfilt:
+        def apply_filter(chunk):
+            return sosfiltfilt(sos, data[chunk], axis=1)
+    else:
+        # initial conditions as sections x channels x 2
+        zi = sosfilt_zi(sos)[:, np.newaxis, :] * data[:, :1]
+
+        def apply_filter(chunk):
+            return sosfilt(sos, data[chunk], axis=1, zi=zi[:, chunk])[0]
+
+    if workers is None:
+        workers = get_available_cpus()
+    workers = max(min(workers, data.shape[0]), 1)
+    if workers == 1:
+        return apply_filter(slice(None))
+
+    filtered = np.empty(data.shape, dtype=np.result_type(data, sos))
+
+    def filter_chunk(chunk):
+        filtered[chunk] = apply_filter(chunk)
+
+    chunks = [slice(c[0], c[-1] + 1) for c in
+              np.array_split(np.arange(data.shape[0]), workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list to re-raise exceptions of threads, if any
+        list(executor.map(filter_chunk, chunks))
+    return filtered
+
+
+def highpass_sos_mne(cnt, low_cut_hz, filt_order=3, filtfilt=False,
+                     workers=None):
+    """Highpass continuous data with a Butterworth filter in SOS form.
+
+    The filter is applied along time as cascaded second-order sections,
+    which are numerically stable also for very low cut frequencies;
+    channels are filtered in parallel with :func:`sosfilt_channels`,
+    which starts the causal filter from the steady state of each channel.
+
+    Parameters
+    ----------
+    cnt : mne.io.RawArray
+        continuous data
+    low_cut_hz : float
+        cut frequency of the filter
+    filt_order : int
+        order of the Butterworth filter
+    filtfilt : bool
+        if True the filter is applied forward and backward (zero phase),
+        else only forward (causal)
+    workers : int, optional
+        number of threads; if None all cpu available to the process are
+        used
+
+    Returns
+    -------
+    cnt : mne.io.RawArray
+        filtered continuous data
+    """
+    sos = design_butter_sos(low_cut_hz, None, cnt.info['sfreq'], filt_order)
+    return mne_apply(
+        lambda data: sosfilt_channels(sos, data, filtfilt=filtfilt,
+                                      workers=workers),
+        cnt
+    )
+
+
+def bandpass_mne(cnt, low_cut_hz, high_cut_hz, filt_order=3, filtfilt=False,
+                 workers=None):
+    """Bandpass continuous data with a Butterworth filter in SOS form.
+
+    Same as braindecode bandpass_cnt applied along time (a low-pass if
+    low_cut_hz is 0 or None, a high-pass if high_cut_hz is None or the
+    nyquist frequency), but the filter design is cached and channels are
+    filtered in parallel as cascaded second-order sections; the causal
+    filter starts from the steady state of the first sample of each
+    channel (see :func:`sosfilt_channels`), so there is no start transient.
+
+    Parameters
+    ----------
+    cnt : mne.io.RawArray
+        continuous data
+    low_cut_hz : float or None
+        low cut frequency
+    high_cut_hz : float or None
+        high cut frequency
+    filt_order : int
+        order of the Butterworth filter
+    filtfilt : bool
+        if True the filter is applied forward and backward (zero phase),
+        else only forward (causal)
+    workers : int, optional
+        number of threads; if None all cpu available to the process are
+        used
+
+    Returns
+    -------
+    cnt : mne.io.RawArray
+        filtered continuous data
+    """
+    fs = cnt.info['sfreq']
+    if high_cut_hz is not None and high_cut_hz >= fs / 2.0:
+        high_cut_hz = None
+    if low_cut_hz == 0:
+        low_cut_hz = None
+    if low_cut_hz is None and high_cut_hz is None:
+        log.info('Not doing any bandpass, since low 0 or None and high '
+                 'None or nyquist frequency')
+        return deepcopy(cnt)
+    sos = design_butter_sos(low_cut_hz, high_cut_hz, fs, filt_order)
+    return mne_apply(
+        lambda data: sosfilt_channels(sos, data, filtfilt=filtfilt,
+                                      workers=workers),
+        cnt
+    )
+
+
+def resample_poly_mne(cnt, new_fs):
+    """Resample continuous data with a polyphase filter.
+
+    Same as braindecode resample_cnt, but the signal is resampled with
+    scipy resample_poly (upsampling, FIR filtering and downsampling in a
+    single pass) instead of resampy, which is faster and lighter on memory
+    for long continuous recordings. The ratio between new and old sampling
+    frequency must be a fraction with small terms (e.g. 250 / 500 = 1 / 2),
+    so that data, events and sampling frequency stay exactly consistent.
+    Events are moved to the new sampling rate too.
+
+    Parameters
+    ----------
+    cnt : mne.io.RawArray
+        continuous data, with events in ``cnt.info['events']``
+    new_fs : float
+        new sampling frequency
+
+    Returns
+    -------
+    cnt : mne.io.RawArray
+        resampled continuous data
+    """
+    old_fs = cnt.info['sfreq']
+    if new_fs == old_fs:
+        log.info('Just copying data, no resampling, since new sampling '
+                 'rate same.')
+        return deepcopy(cnt)
+    log.info('Resampling from {:f} to {:f} Hz.'.format(old_fs, new_fs))
+
+    # getting up and down factors as the exact reduced fraction
+    ratio = Fraction(new_fs) / Fraction(old_fs)
+    if ratio.numerator > 1000 or ratio.denominator > 1000:
+        raise ValueError(
+            'Cannot resample from {} to {} Hz: their ratio is not a '
+            'fraction with small terms.'.format(old_fs, new_fs)
+        )
+    new_data = resample_poly(cnt.get_data(),
+                             up=ratio.numerator,
+                             down=ratio.denominator,
+                             axis=1)
+
+    # moving events and sampling frequency to the new rate
+    new_info = deepcopy(cnt.info)
+    new_info['sfreq'] = new_fs
+    events = new_info['events']
+    events[:, 0] = np.round(events[:, 0] * ratio.numerator /
+                            float(ratio.denominator))
+    return RawArray(new_data, new_info, verbose='WARNING')
 
 
 def select_trials(dataset, inds):
     if hasattr(dataset.X, 'ndim'):
         # numpy array
-        new_X = np.array(dataset.X)[inds]
+        new_X = np.asarray(dataset.X)[inds]
     else:
         # list
         new_X = [dataset.X[i] for i in inds]
@@ -26,6 +268,31 @@ def select_trials(dataset, inds):
     return SignalAndTarget(new_X, new_y)
 
 
+def select_clean_trials(dataset, clean_trial_mask):
+    """Keep only trials of dataset which are valid in clean_trial_mask.
+
+    Trials are gathered with np.take in a preallocated array; since the
+    indexes come from the mask they are always in range, so mode='clip'
+    is used and np.take writes straight into the output (with the default
+    mode='raise' it would go through a buffer as big as the output).
+    dataset is changed in place and returned.
+    """
+    assert len(clean_trial_mask) == len(dataset.X), \
+        'clean_trial_mask and dataset must have the same number of trials'
+    inds = np.flatnonzero(clean_trial_mask)
+    if hasattr(dataset.X, 'ndim'):
+        # numpy array
+        new_X = np.empty((len(inds),) + dataset.X.shape[1:],
+                         dtype=dataset.X.dtype)
+        np.take(dataset.X, inds, axis=0, out=new_X, mode='clip')
+    else:
+        # list
+        new_X = [dataset.X[i] for i in inds]
+    dataset.X = new_X
+    dataset.y = np.asarray(dataset.y)[inds]
+    return dataset
+
+
 def select_classes_cnt(cnt, class_numbers):
     cnt = deepcopy(cnt)
     events = cnt.info['events']
@@ -71,6 +338,115 @@ def extract_all_start_codes(name_to_start_codes):
     return all_start_codes
 
 
+def ival_ms_to_sample_offsets(ival_ms, fs):
+    """Convert an epoch interval in ms in (start, stop) sample offsets.
+
+    Offsets are relative to the event sample and rounded as braindecode
+    does when epoching (round for start, ceil for the exclusive stop).
+    """
+    start_offset = int(round(ival_ms[0] * fs / 1000.0))
+    stop_offset = int(ceil(ival_ms[1] * fs / 1000.0))
+    return start_offset, stop_offset
+
+
+def get_trial_event_indexes(cnt, name_to_start_codes, ival_ms):
+    """Get indexes of the events that give a trial in continuous data.
+
+    Events are kept with the same rules of braindecode
+    create_signal_target_from_raw_mne: the event code must be one of the
+    start codes and the whole epoch interval must fall inside the signal,
+    so the i-th returned index is the event of the i-th epoched trial.
+
+    Parameters
+    ----------
+    cnt : mne.io.RawArray
+        continuous data, with events in ``cnt.info['events']``
+    name_to_start_codes : OrderedDict
+        class names and their start codes
+    ival_ms : tuple of two floats
+        epoch interval in milliseconds, relative to the event
+
+    Returns
+    -------
+    indexes : 1d array of ints
+        indexes of trial events in ``cnt.info['events']``
+    """
+    start_offset, stop_offset = ival_ms_to_sample_offsets(
+        ival_ms, cnt.info['sfreq'])
+    events = cnt.info['events']
+    is_trial = np.isin(events[:, 2],
+                       extract_all_start_codes(name_to_start_codes))
+    is_trial &= events[:, 0] + start_offset >= 0
+    is_trial &= events[:, 0] + stop_offset <= cnt.n_times
+    return np.flatnonzero(is_trial)
+
+
+def create_signal_target_from_cnt(cnt, name_to_start_codes, epoch_ival_ms):
+    """Epoch continuous data in a preallocated float32 array.
+
+    Same output of braindecode create_signal_target_from_raw_mne (without
+    stop codes), but the epoched array is allocated once and trials are
+    copied straight into it, instead of stacking a list of trials. If a
+    list of cnts is given, trials of all of them are counted first and
+    copied in the same array, in list order, so that continuous data never
+    need to be concatenated.
+
+    Parameters
+    ----------
+    cnt : mne.io.RawArray or list of mne.io.RawArray
+        continuous data, with events in ``cnt.info['events']``; all cnts
+        of a list must have the same channels and sampling frequency
+    name_to_start_codes : OrderedDict
+        class names and their start codes; class labels follow the order
+        of this dict
+    epoch_ival_ms : tuple of two floats
+        epoch interval in milliseconds, relative to the event
+
+    Returns
+    -------
+    epo : SignalAndTarget
+        X as trials x channels x samples float32 array, y as int64 labels
+    """
+    cnts = cnt if isinstance(cnt, (list, tuple)) else [cnt]
+
+    # mapping each start code to its class label
+    code_to_y = {}
+    for i_class, codes in enumerate(name_to_start_codes.values()):
+        if hasattr(codes, '__len__'):
+            code_to_y.update((code, i_class) for code in codes)
+        else:
+            code_to_y[codes] = i_class
+
+    # getting trial events of each cnt, so the whole epoched array can be
+    # allocated before copying any trial
+    fs = cnts[0].info['sfreq']
+    n_chans = cnts[0]._data.shape[0]
+    assert all(c_cnt.info['sfreq'] == fs and
+               c_cnt._data.shape[0] == n_chans for c_cnt in cnts), \
+        'all cnts must have the same channels and sampling frequency'
+    start_offset, stop_offset = ival_ms_to_sample_offsets(epoch_ival_ms, fs)
+    events_list = [
+        c_cnt.info['events'][
+            get_trial_event_indexes(c_cnt, name_to_start_codes, epoch_ival_ms)
+        ]
+        for c_cnt in cnts
+    ]
+    n_trial_samples = stop_offset - start_offset
+    n_trials = sum(len(events) for events in events_list)
+
+    # filling epoched array trial by trial, cnt after cnt
+    X = np.empty((n_trials, n_chans, n_trial_samples), dtype=np.float32)
+    y = np.empty(n_trials, dtype=np.int64)
+    i_trial = 0
+    for c_cnt, events in zip(cnts, events_list):
+        data = c_cnt._data
+        for i_start, code in zip(events[:, 0] + start_offset, events[:, 2]):
+            X[i_trial] = data[:, i_start:i_start + n_trial_samples]
+            y[i_trial] = code_to_y[code]
+            i_trial += 1
+    return SignalAndTarget(X, y)
+
+
 def calculate_csp(epo, classes=None, average_trial_covariance=False):
     """Calculate the Common Spatial Pattern (CSP) for two classes.
     Now with pattern computation as in matlab bbci toolbox
@@ -8,6 +8,7 @@ from os import system
 from os import listdir
 from os import makedirs
 from os import remove
+from os import cpu_count
 from sys import platform
 from pickle import dump
 from os.path import join
@@ -93,6 +94,21 @@ def touch_file(file_path):
         return False
 
 
+def get_available_cpus():
+    """
+    Return the number of cpu this process can run on; unlike cpu_count,
+    it follows the cpu affinity of the process (set e.g. with taskset or
+    by the cgroup cpuset of a container or of a job scheduler). Where
+    sched_getaffinity is not available (Windows, macOS) it falls back to
+    cpu_count.
+    """
+    try:
+        from os import sched_getaffinity
+    except ImportError:
+        return cpu_count() or 1
+    return len(sched_getaffinity(0))
+
+
 def listdir2(path):
     l = listdir(path)
     idx = 0
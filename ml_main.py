@@ -8,6 +8,7 @@ from hgdecode.utils import my_formatter
 from hgdecode.utils import ml_results_saver
 from hgdecode.classes import CrossValidation
 from hgdecode.loaders import ml_loader
+from hgdecode.loaders import load_and_preprocess_subjects
 from hgdecode.experiments import FBCSPrLDAExperiment
 
 """
@@ -31,6 +32,9 @@ results_dir : str
 subject_ids : tuple
     All the subject ids in a tuple; add or remove subjects to run the
     algorithm for them or not
+workers : int
+    Number of processes loading subjects; if greater than 1, next subjects
+    are loaded while the experiment runs on the current one
 """
 # setting ml_algorithm
 algorithm_name = 'FBCSP_rLDA'
@@ -65,6 +69,7 @@ standardize_mode = 0
 subject_ids = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14)
 ival = (-500, 4000)
 n_folds = 6
+workers = 1
 
 # fold stuff
 ival_str = str(ival[0]) + '_' + str(ival[1])
@@ -80,7 +85,23 @@ this dataset will be used to create an instance of the experiment; then the
 experiment will be run. You can of course change all the experiment inputs
 to obtain different results.
 """
-for subject_id in subject_ids:
+# loading datasets one subject at a time (on workers processes)
+subjects_outputs = load_and_preprocess_subjects(
+    subject_ids=subject_ids,
+    workers=workers,
+    subject_loader=ml_loader,
+    data_dir=data_dir,
+    name_to_start_codes=name_to_start_codes,
+    channel_names=channel_names,
+    resampling_freq=250,  # Schirrmeister: 250
+    clean_ival_ms=ival,  # Schirrmeister: (0, 4000)
+    train_test_split=True,  # Schirrmeister: True
+    clean_on_all_channels=False,  # Schirrmeister: True
+    standardize_mode=standardize_mode  # Schirrmeister: 2
+)
+
+for subject_id, (cnt, clean_trial_mask) in zip(subject_ids,
+                                                subjects_outputs):
     # creating a log object
     subj_results_dir = create_log(
         results_dir=results_dir,
@@ -90,19 +111,6 @@ for subject_id in subject_ids:
         output_on_file=False
     )
 
-    # loading dataset
-    cnt, clean_trial_mask = ml_loader(
-        data_dir=data_dir,
-        name_to_start_codes=name_to_start_codes,
-        channel_names=channel_names,
-        subject_id=subject_id,
-        resampling_freq=250,  # Schirrmeister: 250
-        clean_ival_ms=ival,  # Schirrmeister: (0, 4000)
-        train_test_split=True,  # Schirrmeister: True
-        clean_on_all_channels=False,  # Schirrmeister: True
-        standardize_mode=standardize_mode  # Schirrmeister: 2
-    )
-
     # creating experiment instance
     exp = FBCSPrLDAExperiment(
         # signal-related inputs
@@ -44,6 +44,9 @@ random_state = RandomState(1234)
 # setting subject_ids
 subject_ids = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14)
 
+# setting workers (number of processes loading subjects in parallel)
+workers = 1
+
 # %%
 """
 STARTING LOADING ROUTINE & COMPUTATION
@@ -67,7 +70,8 @@ cross_obj = CrossSubject(data_dir=data_dir,
                          train_test_split=True,
                          clean_ival_ms=(-1000, 1000),
                          epoch_ival_ms=(-1000, 1000),
-                         clean_on_all_channels=False)
+                         clean_on_all_channels=False,
+                         workers=workers)
 
 """
 Si potrebbe fare un soft parsing così trova le fold, poi si passa ad exp